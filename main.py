@@ -1,13 +1,85 @@
 # main.py
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.concurrency import run_in_threadpool
-import requests
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES
+from starlette.datastructures import Headers
+from starlette.background import BackgroundTask
+import httpx
+import asyncio
 import os
 import mimetypes
+import re
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from functools import lru_cache
+from contextlib import asynccontextmanager
 import urllib.parse
-import json # Ensure json is imported for json.loads and JSONDecodeError
+import orjson
+
+# Errors are logged through a queue so formatting and writing to stderr happen on the
+# listener's thread instead of blocking the event loop.
+logger = logging.getLogger("telesocial")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+_log_queue = queue.SimpleQueue()
+logger.addHandler(QueueHandler(_log_queue))
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = QueueListener(_log_queue, _log_stream_handler)
+_log_listener_running = False
+
+# Started from lifespan, or on the first upstream call on hosts without lifespan events.
+def _start_log_listener():
+    global _log_listener_running
+    if not _log_listener_running:
+        _log_listener.start()
+        _log_listener_running = True
+
+def _stop_log_listener():
+    global _log_listener_running
+    if _log_listener_running:
+        # Flushes any queued records before the listener thread exits.
+        _log_listener.stop()
+        _log_listener_running = False
+
+# Shared async HTTP client for all upstream calls, created on first use so connections are
+# pooled and no worker threads are needed per request. Created lazily rather than at
+# startup because not every host (e.g. Vercel's Python builder) runs ASGI lifespan events.
+# Its connections are bound to the event loop it was built on, so it is rebuilt when a host
+# drives requests on a new loop.
+http_client: httpx.AsyncClient | None = None
+_http_client_loop: asyncio.AbstractEventLoop | None = None
+
+def _get_http_client() -> httpx.AsyncClient:
+    global http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if http_client is None or _http_client_loop is not loop:
+        # Connection limits live on the transport; retries only cover failed connection attempts.
+        # HTTP/2 lets concurrent downloads share one connection when the upstream negotiates it.
+        transport = httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+            retries=2,
+        )
+        # Upstream JSON bodies are compressible; httpx decodes them transparently on read.
+        http_client = httpx.AsyncClient(timeout=90, transport=transport, headers={"Accept-Encoding": "gzip, br"})
+        _http_client_loop = loop
+    return http_client
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global http_client
+    _start_log_listener()
+    try:
+        yield
+    finally:
+        if http_client is not None and _http_client_loop is asyncio.get_running_loop():
+            await http_client.aclose()
+        http_client = None
+        _stop_log_listener()
 
 # Create the FastAPI app instance
 # Vercel will look for this 'app' object.
@@ -15,7 +87,8 @@ app = FastAPI(
     title="TeleSocial Proxy API",
     description="A proxy API to interact with the tele-social.vercel.app downloader. "
                 "Access the interactive API documentation at /docs or /redoc.",
-    version="1.0.2"
+    version="1.0.2",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -27,130 +100,206 @@ app.add_middleware(
     allow_headers=["*"], # Allows all headers
 )
 
-# Synchronous helper function to perform the blocking network request
-def _fetch_from_tele_social_sync(target_url: str, api_base_url: str, params: dict):
-    try:
-        upstream_response = requests.get(api_base_url, params=params, timeout=90, stream=True)
-        if upstream_response.status_code >= 400:
-            return {"type": "error_upstream", "response_object": upstream_response}
-        return {"type": "success", "response_object": upstream_response}
-    except requests.exceptions.Timeout:
-        return {"type": "exception", "exception_type": "Timeout", "detail": f"Request to upstream API timed out for URL: {target_url}"}
-    except requests.exceptions.ConnectionError:
-        return {"type": "exception", "exception_type": "ConnectionError", "detail": f"Could not connect to upstream API for URL: {target_url}"}
-    except requests.exceptions.RequestException as e:
-        return {"type": "exception", "exception_type": "RequestException", "detail": f"Upstream API request error for {target_url}: {str(e)}"}
-
-async def get_content_from_tele_social(target_url: str):
-    api_base_url = "https://tele-social.vercel.app/down"
-    params = {'url': target_url}
-    result_dict = await run_in_threadpool(_fetch_from_tele_social_sync, target_url, api_base_url, params)
-
-    if result_dict["type"] == "exception":
-        if result_dict["exception_type"] == "Timeout":
-            raise HTTPException(status_code=504, detail=result_dict["detail"])
-        elif result_dict["exception_type"] == "ConnectionError":
-            raise HTTPException(status_code=503, detail=result_dict["detail"])
-        else: # RequestException
-            raise HTTPException(status_code=500, detail=result_dict["detail"])
-    return result_dict["response_object"]
-
-def _parse_json_and_close_sync(resp: requests.Response):
+# Compress JSON responses. Already-encoded responses, Starlette's default exclusions
+# (video/*, audio/*, common image and archive types) and generic binaries are left as-is;
+# other non-JSON downloads (e.g. text/*, application/pdf) are still compressed.
+# Starlette only looks for "gzip" as a substring of Accept-Encoding, which would still compress
+# for clients that refuse it (e.g. "gzip;q=0"); check the header properly first.
+class AcceptEncodingGZipMiddleware(GZipMiddleware):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not _client_accepts_encoding(Headers(scope=scope).get("accept-encoding", ""), "gzip"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+app.add_middleware(
+    AcceptEncodingGZipMiddleware,
+    minimum_size=512,
+    exclude_content_types=DEFAULT_EXCLUDED_CONTENT_TYPES + ("application/octet-stream",),
+)
+
+# JSON response rendered with orjson (FastAPI's own ORJSONResponse is deprecated).
+class ORJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+# Load the mimetypes tables once at import instead of lazily on the first download.
+mimetypes.init()
+
+# Characters not allowed in a generated download filename.
+_FILENAME_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9._-]")
+
+@lru_cache(maxsize=256)
+def _guess_extension(content_type: str) -> str:
+    return mimetypes.guess_extension(content_type) or ""
+
+# Build a safe download filename from the target URL, cached so repeated downloads skip the parsing.
+@lru_cache(maxsize=1024)
+def _derive_filename(target_url: str, content_type: str) -> str:
     try:
-        data = resp.json()
-        return data
-    finally:
-        resp.close()
+        parsed_target_url = urllib.parse.urlparse(target_url)
+        path_basename = os.path.basename(parsed_target_url.path)
+        filename = "downloaded_file"
+        if path_basename:
+            filename_stem = path_basename.split("?")[0].split("#")[0]
+            guessed_extension = _guess_extension(content_type or 'application/octet-stream')
+            if guessed_extension and not filename_stem.lower().endswith(guessed_extension.lower()):
+                filename = f"{filename_stem}{guessed_extension}"
+            else:
+                filename = filename_stem
+        filename = _FILENAME_UNSAFE_CHARS.sub("", filename)
+        if not filename: filename = "downloaded_file"
+        return filename
+    except Exception:
+        return "downloaded_file"
+
+# Whether an Accept-Encoding header allows a single content coding (e.g. "gzip") with q > 0.
+# An explicitly listed coding takes precedence over "*" (RFC 9110, section 12.5.3).
+def _client_accepts_encoding(accept_encoding: str, encoding: str) -> bool:
+    encoding = encoding.strip().lower()
+    explicit_quality = None
+    wildcard_quality = None
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if name != encoding and name != "*":
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name == encoding:
+            explicit_quality = quality
+        else:
+            wildcard_quality = quality
+    quality = explicit_quality if explicit_quality is not None else wildcard_quality
+    return quality is not None and quality > 0
 
-def _read_text_and_close_sync(resp: requests.Response):
+UPSTREAM_API_BASE_URL = "https://tele-social.vercel.app/down"
+
+# Size of the chunks streamed to the client for file downloads; larger chunks mean
+# fewer send() calls and loop iterations per MB. Override with STREAM_CHUNK_SIZE (bytes).
+default_stream_chunk_size = 256 * 1024
+try:
+    STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", str(default_stream_chunk_size)))
+except ValueError:
+    STREAM_CHUNK_SIZE = default_stream_chunk_size
+if STREAM_CHUNK_SIZE <= 0:
+    STREAM_CHUNK_SIZE = default_stream_chunk_size
+
+async def get_content_from_tele_social(target_url: str) -> httpx.Response:
+    # The response is returned with its body unread; the caller is responsible for closing it.
+    _start_log_listener()
+    client = _get_http_client()
+    request = client.build_request("GET", UPSTREAM_API_BASE_URL, params={'url': target_url})
     try:
-        text_data = resp.text
-        return text_data
-    finally:
-        resp.close()
+        return await client.send(request, stream=True)
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail=f"Request to upstream API timed out for URL: {target_url}")
+    except httpx.ConnectError:
+        raise HTTPException(status_code=503, detail=f"Could not connect to upstream API for URL: {target_url}")
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=500, detail=f"Upstream API request error for {target_url}: {str(e)}")
 
-@app.get("/download/")
+# Responses are built by hand, so no response model is inferred or validated.
+@app.get("/download/", response_model=None, response_class=ORJSONResponse)
 async def download_content_via_proxy(
     url: str = Query(..., 
+                     min_length=1,
+                     max_length=2048,
                      description="The URL of the content you want the tele-social API to process (e.g., Instagram post URL, TikTok video URL).",
-                     examples=["https://www.instagram.com/p/Cxyz1234/"])
+                     examples=["https://www.instagram.com/p/Cxyz1234/"]),
+    accept_encoding: str = Header("", include_in_schema=False)
 ):
-    if not url:
-        raise HTTPException(status_code=400, detail="The 'url' query parameter is required.")
-
     upstream_response = await get_content_from_tele_social(url)
     response_status_code = upstream_response.status_code
-    content_type = upstream_response.headers.get('content-type', '').lower()
+    upstream_headers = upstream_response.headers
+    upstream_content_type = upstream_headers.get('content-type') or ''
+    is_json = upstream_content_type[:16].lower() == 'application/json'
     
     if response_status_code >= 400: # Upstream error
         try:
-            error_body_text = await run_in_threadpool(_read_text_and_close_sync, upstream_response)
             try:
-                error_json = json.loads(error_body_text)
-                return JSONResponse(content=error_json, status_code=response_status_code)
-            except json.JSONDecodeError:
-                return JSONResponse(
-                    content={"error": "Upstream API error", "details": error_body_text, "upstream_status_code": response_status_code}, 
-                    status_code=response_status_code
-                )
+                error_body = await upstream_response.aread()
+            finally:
+                await upstream_response.aclose()
+            if 'json' in upstream_content_type.lower(): # Forward any JSON error (incl. +json types) as-is
+                return Response(content=error_body, media_type=upstream_content_type, status_code=response_status_code)
+            return ORJSONResponse(
+                content={"error": "Upstream API error", "upstream_status_code": response_status_code},
+                status_code=response_status_code
+            )
         except Exception as e:
-            print(f"Error: Failed to read or process error response body from upstream API for URL {url}. Error: {str(e)}")
+            logger.exception("Failed to read or process error response body from upstream API for URL %s", url)
             raise HTTPException(status_code=502, detail=f"Failed to read or process error response from upstream API: {str(e)}")
 
-    if 'application/json' in content_type: # Successful JSON response
+    if is_json: # Successful JSON response, forwarded as received
         try:
-            json_data = await run_in_threadpool(_parse_json_and_close_sync, upstream_response)
-            return JSONResponse(content=json_data, status_code=response_status_code)
-        except (requests.exceptions.JSONDecodeError, json.JSONDecodeError) as e:
-            print(f"Error: Upstream API (URL: {url}) declared Content-Type: application/json but failed to provide valid JSON. Upstream Decode Error: {str(e)}")
-            raise HTTPException(status_code=502, detail="Upstream API returned malformed JSON despite declaring JSON content type.")
-        except Exception as e:
-            print(f"Error: Unexpected issue processing successful JSON response for URL {url}. Error: {str(e)}")
+            try:
+                json_body = await upstream_response.aread()
+            finally:
+                await upstream_response.aclose()
+            return Response(content=json_body, media_type=upstream_content_type, status_code=response_status_code)
+        except Exception:
+            logger.exception("Unexpected issue reading successful JSON response for URL %s", url)
             raise HTTPException(status_code=500, detail="Server error while processing upstream JSON response.")
     else: # Stream as file
-        response_headers = {}
-        if 'content-type' in upstream_response.headers:
-            response_headers['Content-Type'] = upstream_response.headers['content-type']
-        
-        if 'content-disposition' in upstream_response.headers:
-            response_headers['Content-Disposition'] = upstream_response.headers['content-disposition']
+        content_disposition = upstream_headers.get('content-disposition')
+        if not content_disposition:
+            content_disposition = f'attachment; filename="{_derive_filename(url, upstream_content_type)}"'
+
+        # Bodies are passed through raw, with their length and encoding, whenever the client can
+        # take them as-is (unencoded, or an encoding the client accepts). Otherwise decode here.
+        upstream_content_encoding = upstream_headers.get('content-encoding')
+        if not upstream_content_encoding or _client_accepts_encoding(accept_encoding, upstream_content_encoding):
+            body_chunks = upstream_response.aiter_raw(chunk_size=STREAM_CHUNK_SIZE)
+            content_length = upstream_headers.get('content-length')
         else:
+            body_chunks = upstream_response.aiter_bytes(chunk_size=STREAM_CHUNK_SIZE)
+            content_length = None
+            upstream_content_encoding = None
+
+        response_headers = {name: value for name, value in (
+            ('Content-Type', upstream_content_type),
+            ('Content-Disposition', content_disposition),
+            ('Content-Length', content_length),
+            ('Content-Encoding', upstream_content_encoding),
+        ) if value}
+        if upstream_content_encoding:
+            # Passed through encoded because this client accepts it, so caches must key on
+            # Accept-Encoding. GZipMiddleware skips encoded responses and adds no Vary of its own.
+            response_headers['Vary'] = 'Accept-Encoding'
+
+        # Close the upstream response even if the upstream or the client fails mid-stream;
+        # the background task alone only runs when streaming completes normally.
+        async def file_streaming_generator(resp: httpx.Response, chunks):
             try:
-                parsed_target_url = urllib.parse.urlparse(url)
-                path_basename = os.path.basename(parsed_target_url.path)
-                filename = "downloaded_file"
-                if path_basename:
-                    filename_stem = path_basename.split("?")[0].split("#")[0]
-                    guessed_extension = mimetypes.guess_extension(response_headers.get('Content-Type', 'application/octet-stream'))
-                    if guessed_extension and not filename_stem.lower().endswith(guessed_extension.lower()):
-                        filename = f"{filename_stem}{guessed_extension}"
-                    else:
-                        filename = filename_stem
-                filename = "".join(c for c in filename if c.isalnum() or c in ['.', '_', '-']).strip()
-                if not filename: filename = "downloaded_file"
-                response_headers['Content-Disposition'] = f'attachment; filename="{filename}"'
-            except Exception:
-                response_headers['Content-Disposition'] = 'attachment; filename="downloaded_file"'
-
-        if 'content-length' in upstream_response.headers:
-            response_headers['Content-Length'] = upstream_response.headers['content-length']
-
-        async def file_streaming_generator(resp: requests.Response, chunk_size=1024*64):
-            try:
-                for chunk in resp.iter_content(chunk_size=chunk_size):
+                async for chunk in chunks:
                     yield chunk
             finally:
-                await run_in_threadpool(resp.close)
+                await resp.aclose()
 
         return StreamingResponse(
-            file_streaming_generator(upstream_response),
+            file_streaming_generator(upstream_response, body_chunks),
             status_code=response_status_code,
-            headers=response_headers
+            headers=response_headers,
+            background=BackgroundTask(upstream_response.aclose)
         )
 
 # The if __name__ == "__main__": block for local uvicorn execution is optional for Vercel.
 # Vercel uses its own mechanism to serve the 'app' object.
 # You can keep it for local testing if you wish.
+# uvloop and httptools come with uvicorn[standard]; requesting them explicitly makes
+# uvicorn fail loudly instead of silently falling back to asyncio / h11.
+# Equivalent CLI: uvicorn main:app --loop uvloop --http httptools
+# For a self-hosted deployment the proxy is I/O-bound, so run more workers than cores, e.g.
+#   uvicorn main:app --loop uvloop --http httptools --workers $((2 * $(nproc)))
+# or gunicorn main:app -k uvicorn.workers.UvicornWorker -w $((2 * $(nproc))) --worker-tmp-dir /dev/shm
+# and pin them with taskset if needed. Each worker gets its own event loop and upstream connection pool.
 # if __name__ == "__main__":
 #     import uvicorn
 #     default_port = 8000
@@ -161,4 +310,4 @@ async def download_content_via_proxy(
 #     print(f"--- Starting TeleSocial Proxy API (Local Development) ---")
 #     print(f"INFO:     Uvicorn running on http://0.0.0.0:{port} (Press CTRL+C to quit)")
 #     print(f"INFO:     Access API docs at http://127.0.0.1:{port}/docs")
-#     uvicorn.run(app, host="0.0.0.0", port=port)
+#     uvicorn.run(app, host="0.0.0.0", port=port, loop="uvloop", http="httptools")
@@ -0,0 +1,38 @@
+from main import _client_accepts_encoding
+
+
+def test_accepts_listed_encoding():
+    assert _client_accepts_encoding("gzip, deflate, br", "br")
+    assert _client_accepts_encoding("GZIP", "gzip")
+
+
+def test_rejects_unlisted_encoding():
+    assert not _client_accepts_encoding("", "gzip")
+    assert not _client_accepts_encoding("identity", "gzip")
+    assert not _client_accepts_encoding("deflate, br", "gzip")
+
+
+def test_zero_quality_rejects_encoding():
+    assert not _client_accepts_encoding("gzip;q=0", "gzip")
+    assert not _client_accepts_encoding("gzip; q=0.0, br", "gzip")
+    assert _client_accepts_encoding("gzip;q=0.5", "gzip")
+
+
+def test_malformed_quality_rejects_encoding():
+    assert not _client_accepts_encoding("gzip;q=abc", "gzip")
+
+
+def test_wildcard_applies_to_unlisted_encoding():
+    assert _client_accepts_encoding("*", "gzip")
+    assert _client_accepts_encoding("br, *;q=0.1", "gzip")
+    assert not _client_accepts_encoding("*;q=0", "gzip")
+
+
+def test_explicit_encoding_overrides_wildcard():
+    assert not _client_accepts_encoding("gzip;q=0, *", "gzip")
+    assert not _client_accepts_encoding("*, gzip;q=0", "gzip")
+    assert _client_accepts_encoding("*;q=0, gzip", "gzip")
+
+
+def test_multiple_codings_are_not_matched():
+    assert not _client_accepts_encoding("gzip, br", "gzip, br")